@@ -0,0 +1,289 @@
+"""
+Respostas em lote para o chatbot (FAQ pré-gerado, aquecimento de cache, regressão).
+
+Exemplos:
+    python batch_answer.py perguntas.jsonl respostas.jsonl --concurrency 8 --tpm 60000
+    python batch_answer.py perguntas.csv respostas.jsonl --mock-llm
+
+Entrada: JSONL ({"id": ..., "question": ...}) ou CSV com as mesmas colunas
+(`id` é opcional; sem ele, usa o número da linha).
+Saída: JSONL, uma resposta por linha, gravada conforme as respostas ficam prontas.
+A própria saída é o checkpoint: rodar de novo pula os ids já respondidos.
+
+Com --mock-llm não é preciso Azure: as variáveis AZURE_OPENAI_* recebem valores
+fictícios antes de importar o pipeline (o Key Vault não é consultado) e o client
+aponta para um servidor local de completions.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+# =====================
+# RATE LIMIT (tokens por minuto)
+# =====================
+class TokenRateLimiter:
+    """
+    Token bucket: enche `tokens_per_minute` por minuto, com capacidade de 1 minuto.
+    `acquire(n)` bloqueia até haver saldo para n tokens.
+    """
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self._saldo = self.capacity
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n_tokens: int):
+        n = min(float(n_tokens), self.capacity)
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._saldo = min(self.capacity, self._saldo + (agora - self._ultimo) * self.rate)
+                self._ultimo = agora
+                if self._saldo >= n:
+                    self._saldo -= n
+                    return
+                espera = (n - self._saldo) / self.rate
+            time.sleep(espera)
+
+
+# =====================
+# MOCK DO AZURE OPENAI (testes locais)
+# =====================
+class _MockCompletionHandler(BaseHTTPRequestHandler):
+    latency_s = 0.05
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(tamanho) or b"{}")
+        user = next((m["content"] for m in body.get("messages", []) if m.get("role") == "user"), "")
+        pergunta = user.split("\n\nCONTEXTO:")[0].replace("PERGUNTA:\n", "").strip()
+
+        time.sleep(self.latency_s)
+        resposta = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": f"[mock] Resposta para: {pergunta}"},
+            }],
+            "usage": {"prompt_tokens": len(user) // 4, "completion_tokens": 10, "total_tokens": len(user) // 4 + 10},
+        }
+        data = json.dumps(resposta).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_mock_completion_server(latency_s: float = 0.05):
+    """
+    Sobe um servidor local que imita o endpoint de chat completions.
+    Retorna (server, endpoint); use server.shutdown() ao final.
+    """
+    handler = type("MockHandler", (_MockCompletionHandler,), {"latency_s": latency_s})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# =====================
+# ENTRADA / SAÍDA
+# =====================
+def ler_perguntas(path: Path, id_field: str = "id", question_field: str = "question"):
+    perguntas = []
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            linhas = list(csv.DictReader(f))
+        else:
+            linhas = [json.loads(l) for l in f if l.strip()]
+
+    for i, row in enumerate(linhas, start=1):
+        pergunta = str(row.get(question_field) or "").strip()
+        if not pergunta:
+            continue
+        qid = row.get(id_field)
+        perguntas.append((str(qid) if qid not in (None, "") else str(i), pergunta))
+    return perguntas
+
+
+def ids_ja_respondidos(path: Path) -> set:
+    if not path.exists():
+        return set()
+    feitos = set()
+    with open(path, encoding="utf-8") as f:
+        for l in f:
+            try:
+                row = json.loads(l)
+            except json.JSONDecodeError:
+                # última linha incompleta (processo interrompido): será refeita
+                continue
+            if not row.get("error"):
+                feitos.add(str(row["id"]))
+    return feitos
+
+
+def _terminar_linha(path: Path):
+    # processo interrompido no meio de uma linha: fecha a linha antes de anexar,
+    # senão a primeira resposta nova gruda na linha truncada
+    if not path.exists() or path.stat().st_size == 0:
+        return
+    with open(path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+# =====================
+# EXECUÇÃO
+# =====================
+def run_batch(perguntas, output: Path, concurrency: int = 4, top_k: int = 10,
+              embed_batch_size: int = 64, log_every: int = 50):
+    import rag_pipeline
+
+    def responder(qid, pergunta):
+        inicio = time.perf_counter()
+        try:
+            r = rag_pipeline.answer_question(pergunta, state={}, top_k=top_k)
+            if r.get("fallback"):
+                # resposta de contingência não conta como respondida: fica para a próxima rodada
+                return {
+                    "id": qid,
+                    "question": pergunta,
+                    "error": "fallback: resposta de contingência (LLM ou embeddings indisponível)",
+                    "text": r.get("text"),
+                    "elapsed_s": round(time.perf_counter() - inicio, 4),
+                }
+            return {
+                "id": qid,
+                "question": pergunta,
+                "text": r.get("text"),
+                "sources": r.get("sources", []),
+                "dish_title": r.get("dish_title"),
+                "elapsed_s": round(time.perf_counter() - inicio, 4),
+            }
+        except Exception as e:
+            return {
+                "id": qid,
+                "question": pergunta,
+                "error": f"{type(e).__name__}: {e}",
+                "elapsed_s": round(time.perf_counter() - inicio, 4),
+            }
+
+    # janelas de perguntas: o retrieval de uma janela é feito em lote (um encode +
+    # um index.search por lote) e fica no cache; no máximo ~2 janelas ficam no cache
+    # ao mesmo tempo, para nada ser descartado antes de o worker usar
+    janela = min(max(2 * concurrency, embed_batch_size), rag_pipeline.RETRIEVAL_CACHE_SIZE // 4)
+
+    n_ok = n_err = n = 0
+    inicio = time.perf_counter()
+
+    def gravar(out, feitos):
+        nonlocal n_ok, n_err, n
+        for fut in feitos:
+            row = fut.result()
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            n += 1
+            if "error" in row:
+                n_err += 1
+            else:
+                n_ok += 1
+            if log_every and n % log_every == 0:
+                print(f"{n}/{len(perguntas)} respondidas ({time.perf_counter() - inicio:.1f}s)", file=sys.stderr)
+
+    # LLM com concorrência limitada; a saída é gravada conforme termina
+    _terminar_linha(output)
+    with open(output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pendentes = set()
+        for ini in range(0, len(perguntas), janela):
+            lote = perguntas[ini:ini + janela]
+            rag_pipeline.retrieve_faiss_batch([q for _, q in lote], top_k=top_k, batch_size=embed_batch_size)
+            pendentes |= {pool.submit(responder, qid, q) for qid, q in lote}
+            # só prepara a próxima janela quando a anterior escoou
+            while len(pendentes) > janela:
+                feitos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                gravar(out, feitos)
+        while pendentes:
+            feitos, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+            gravar(out, feitos)
+        os.fsync(out.fileno())
+
+    return {"ok": n_ok, "erros": n_err, "segundos": round(time.perf_counter() - inicio, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Responde perguntas em lote usando o pipeline RAG.")
+    parser.add_argument("input", type=Path, help="perguntas (.jsonl ou .csv)")
+    parser.add_argument("output", type=Path, help="respostas (.jsonl); também serve de checkpoint")
+    parser.add_argument("--concurrency", type=int, default=4, help="chamadas simultâneas ao LLM")
+    parser.add_argument("--tpm", type=int, default=0, help="limite de tokens por minuto (0 = sem limite)")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--embed-batch-size", type=int, default=64)
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--mock-llm", action="store_true", help="usa um servidor local de completions (sem Azure)")
+    parser.add_argument("--mock-latency", type=float, default=0.05, help="latência do mock, em segundos")
+    args = parser.parse_args(argv)
+
+    perguntas = ler_perguntas(args.input, args.id_field, args.question_field)
+    feitos = ids_ja_respondidos(args.output)
+    pendentes = [(qid, q) for qid, q in perguntas if qid not in feitos]
+    print(f"{len(perguntas)} perguntas, {len(feitos)} já respondidas, {len(pendentes)} pendentes", file=sys.stderr)
+    if not pendentes:
+        return 0
+
+    if args.mock_llm:
+        # credenciais fictícias: o pipeline não precisa ir ao Key Vault
+        for env, valor in [("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1"), ("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+                           ("AZURE_OPENAI_API_KEY", "mock"), ("AZURE_OPENAI_CHAT_DEPLOY", "mock")]:
+            os.environ.setdefault(env, valor)
+
+    import rag_pipeline
+
+    print(rag_pipeline.relatorio_dedup(), file=sys.stderr)
+
+    mock = None
+    if args.mock_llm:
+        from openai import AzureOpenAI
+
+        mock, endpoint = start_mock_completion_server(args.mock_latency)
+        rag_pipeline.client = AzureOpenAI(api_key="mock", api_version="2024-02-01", azure_endpoint=endpoint)
+
+    if args.tpm:
+        rag_pipeline.set_llm_rate_limiter(TokenRateLimiter(args.tpm))
+
+    try:
+        resumo = run_batch(
+            pendentes, args.output,
+            concurrency=args.concurrency,
+            top_k=args.top_k,
+            embed_batch_size=args.embed_batch_size,
+        )
+    finally:
+        rag_pipeline.set_llm_rate_limiter(None)
+        if mock is not None:
+            mock.shutdown()
+
+    print(json.dumps(resumo, ensure_ascii=False), file=sys.stderr)
+    return 1 if resumo["erros"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
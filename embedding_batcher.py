@@ -0,0 +1,141 @@
+"""
+Micro-batching de embeddings: junta pedidos de encode de várias threads
+(sessões) numa única chamada ao modelo.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+EMBED_MAX_BATCH = 32       # máximo de perguntas por chamada ao modelo
+EMBED_MAX_WAIT_MS = 5.0    # quanto o primeiro pedido do lote pode esperar por companhia
+EMBED_TIMEOUT_S = 10.0     # orçamento do encode de um lote; passou disso, o pedido usa o fallback
+
+
+class EmbeddingIndisponivel(Exception):
+    """O modelo de embeddings não atendeu dentro do prazo."""
+
+
+class EmbeddingBatcher:
+    """
+    Junta pedidos de encode vindos de várias threads: uma thread worker espera
+    até `max_wait_ms` (ou `max_batch_size` pedidos), chama o modelo uma vez
+    e devolve cada vetor a quem pediu. A latência extra por pedido fica
+    limitada a `max_wait_ms`.
+
+    Se o worker não responder em `max_wait_ms + timeout_s`, o pedido desiste
+    do lote e chama `fallback_encode` (padrão: o próprio `encode`) na thread de
+    quem pediu. Um worker morto é recriado no próximo pedido; um worker preso
+    dentro do encode não tem como ser interrompido, então `fallback_encode`
+    deve ter prazo (ex.: levantar EmbeddingIndisponivel se o modelo não liberar).
+    """
+
+    def __init__(self, encode, max_batch_size: int = EMBED_MAX_BATCH, max_wait_ms: float = EMBED_MAX_WAIT_MS,
+                 timeout_s: float = EMBED_TIMEOUT_S, fallback_encode=None):
+        self.encode_fn = encode
+        self.fallback_encode = fallback_encode or encode
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000.0
+        self.timeout_s = timeout_s
+        self._fila = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._lotes = 0
+        self._pedidos = 0
+        self._maior_lote = 0
+        self._espera_total_s = 0.0
+        self._tamanhos = Counter()
+        self._fallbacks = 0
+
+    def _garante_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._loop, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def encode(self, texto: str):
+        """Vetor (1, dim) normalizado para `texto`; bloqueia até o lote ser processado."""
+        self._garante_worker()
+        fut = Future()
+        self._fila.put((str(texto), fut, time.monotonic()))
+        try:
+            return fut.result(timeout=self.max_wait_s + self.timeout_s)
+        except FuturesTimeout:
+            if not fut.cancel() and fut.done():
+                # o lote terminou bem na hora do timeout
+                return fut.result()
+        with self._metrics_lock:
+            self._fallbacks += 1
+        return self.fallback_encode([str(texto)])
+
+    def _coleta_lote(self):
+        lote = [self._fila.get()]
+        fim = time.monotonic() + self.max_wait_s
+        while len(lote) < self.max_batch_size:
+            restante = fim - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self._fila.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _processa_lote(self, lote):
+        inicio = time.monotonic()
+        # pedidos que já desistiram (timeout) ficam de fora
+        lote = [p for p in lote if p[1].set_running_or_notify_cancel()]
+        if not lote:
+            return
+
+        # perguntas repetidas no mesmo lote são codificadas uma vez só
+        unicos = list(dict.fromkeys(t for t, _, _ in lote))
+        try:
+            vetores = self.encode_fn(unicos)
+            pos = {t: i for i, t in enumerate(unicos)}
+            for texto, fut, _ in lote:
+                fut.set_result(vetores[pos[texto]:pos[texto] + 1])
+        except BaseException as e:
+            for _, fut, _ in lote:
+                if not fut.done():
+                    fut.set_exception(e)
+
+        with self._metrics_lock:
+            self._lotes += 1
+            self._pedidos += len(lote)
+            self._maior_lote = max(self._maior_lote, len(lote))
+            self._espera_total_s += sum(inicio - t0 for _, _, t0 in lote)
+            self._tamanhos[len(lote)] += 1
+
+    def _loop(self):
+        # o worker é único e todas as sessões dependem dele: nada pode encerrá-lo
+        while True:
+            lote = []
+            try:
+                lote = self._coleta_lote()
+                self._processa_lote(lote)
+            except BaseException as e:
+                for _, fut, _ in lote:
+                    if not fut.done():
+                        try:
+                            fut.set_exception(e)
+                        except Exception:
+                            pass
+
+    def metrics(self) -> dict:
+        with self._metrics_lock:
+            return {
+                "fila": self._fila.qsize(),
+                "lotes": self._lotes,
+                "pedidos": self._pedidos,
+                "lote_medio": round(self._pedidos / self._lotes, 2) if self._lotes else 0.0,
+                "maior_lote": self._maior_lote,
+                "espera_media_ms": round(self._espera_total_s / self._pedidos * 1000, 2) if self._pedidos else 0.0,
+                "tamanhos_de_lote": dict(sorted(self._tamanhos.items())),
+                "fallbacks": self._fallbacks,
+            }
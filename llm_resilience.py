@@ -0,0 +1,258 @@
+"""
+Cliente LLM resiliente: deadline por pergunta, retries com backoff + jitter,
+hedge de requisições lentas e circuit breaker; e o single-flight que agrupa
+chamadas idênticas concorrentes.
+Não depende do pipeline (modelo, índice, Key Vault), então pode ser testado isolado.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures import TimeoutError as FuturesTimeout
+
+from openai import APIStatusError
+
+
+# =====================
+# SINGLE-FLIGHT
+# =====================
+class _Chamada:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes com a mesma chave: só a primeira executa `fn`,
+    as demais esperam e recebem o mesmo resultado (ou a mesma exceção).
+    A chave é liberada assim que a chamada termina, então não é um cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._em_voo = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            chamada = self._em_voo.get(key)
+            lider = chamada is None
+            if lider:
+                chamada = _Chamada()
+                self._em_voo[key] = chamada
+
+        if not lider:
+            chamada.done.wait()
+            if chamada.error is not None:
+                raise chamada.error
+            return chamada.result
+
+        try:
+            chamada.result = fn()
+        except BaseException as e:
+            chamada.error = e
+            raise
+        finally:
+            with self._lock:
+                self._em_voo.pop(key, None)
+            chamada.done.set()
+        return chamada.result
+
+
+# =====================
+# CONFIGURAÇÃO
+# =====================
+LLM_DEADLINE_S = 12.0         # tempo máximo total por pergunta (SLO)
+LLM_ATTEMPT_TIMEOUT_S = 8.0   # timeout de cada requisição HTTP
+LLM_MAX_RETRIES = 2
+LLM_BACKOFF_BASE_S = 0.25
+LLM_BACKOFF_MAX_S = 2.0
+LLM_HEDGE_ENABLED = True
+LLM_HEDGE_DEFAULT_S = 3.0     # usado até haver amostras suficientes para o p95
+LLM_HEDGE_MIN_S = 0.5
+LLM_BREAKER_FAILURES = 5
+LLM_BREAKER_RESET_S = 30.0
+
+
+class LLMIndisponivel(Exception):
+    """O LLM não respondeu dentro do deadline (ou o circuito está aberto)."""
+
+
+class CircuitBreaker:
+    """
+    closed -> open após `failure_threshold` falhas seguidas;
+    open -> half_open após `reset_timeout_s` (deixa passar uma chamada de teste);
+    half_open -> closed ou open conforme o resultado dessa chamada.
+    `clock` permite controlar o tempo nos testes.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_s: float = 30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self._clock = clock
+        self.state = "closed"
+        self._falhas = 0
+        self._aberto_em = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self._clock() - self._aberto_em >= self.reset_timeout_s:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._falhas = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._falhas += 1
+            if self.state == "half_open" or self._falhas >= self.failure_threshold:
+                self.state = "open"
+                self._aberto_em = self._clock()
+
+
+def _erro_retentavel(e: Exception) -> bool:
+    # 4xx (exceto 408/429) não melhora tentando de novo
+    if isinstance(e, APIStatusError):
+        return e.status_code >= 500 or e.status_code in (408, 429)
+    return True
+
+
+def _falha_do_servico(e: Exception) -> bool:
+    # 4xx: o serviço respondeu (o problema é da requisição), não conta para o breaker
+    return not (isinstance(e, APIStatusError) and e.status_code < 500)
+
+
+class ResilientLLM:
+    """
+    Envolve uma função `call(system, user, timeout=...) -> str` com:
+      - deadline total por pergunta e timeout por tentativa
+      - retries com backoff exponencial + jitter
+      - hedge: segunda requisição se a primeira passar do p95 observado
+      - circuit breaker: falha rápido quando o serviço está fora
+    Levanta LLMIndisponivel quando não há resposta dentro do deadline.
+    """
+
+    def __init__(self, call, deadline_s=LLM_DEADLINE_S, attempt_timeout_s=LLM_ATTEMPT_TIMEOUT_S,
+                 max_retries=LLM_MAX_RETRIES, backoff_base_s=LLM_BACKOFF_BASE_S,
+                 backoff_max_s=LLM_BACKOFF_MAX_S, hedge=LLM_HEDGE_ENABLED,
+                 hedge_default_s=LLM_HEDGE_DEFAULT_S, hedge_min_s=LLM_HEDGE_MIN_S,
+                 breaker=None):
+        self.call = call
+        self.deadline_s = deadline_s
+        self.attempt_timeout_s = attempt_timeout_s
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge = hedge
+        self.hedge_default_s = hedge_default_s
+        self.hedge_min_s = hedge_min_s
+        self.breaker = breaker or CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_S)
+        self._latencias = deque(maxlen=200)
+        self._lat_lock = threading.Lock()
+
+    def hedge_delay(self) -> float:
+        with self._lat_lock:
+            amostras = sorted(self._latencias)
+        if len(amostras) < 20:
+            return max(self.hedge_min_s, self.hedge_default_s)
+        p95 = amostras[int(0.95 * (len(amostras) - 1))]
+        return max(self.hedge_min_s, p95)
+
+    def _chamar(self, system, user, timeout):
+        inicio = time.monotonic()
+        texto = self.call(system, user, timeout=timeout)
+        with self._lat_lock:
+            self._latencias.append(time.monotonic() - inicio)
+        return texto
+
+    def _submeter(self, system, user, timeout):
+        # uma thread por requisição, em vez de um pool fixo: o número de threads
+        # acompanha a concorrência de quem chama, então nenhuma requisição fica
+        # na fila gastando o deadline; abandonadas terminam no timeout do HTTP
+        fut = Future()
+
+        def run():
+            if not fut.set_running_or_notify_cancel():
+                return
+            try:
+                fut.set_result(self._chamar(system, user, timeout))
+            except BaseException as e:
+                fut.set_exception(e)
+
+        threading.Thread(target=run, name="llm-call", daemon=True).start()
+        return fut
+
+    def _tentativa(self, system, user, restante):
+        timeout = min(self.attempt_timeout_s, restante)
+        pendentes = {self._submeter(system, user, timeout)}
+
+        if self.hedge:
+            atraso = self.hedge_delay()
+            if atraso < restante:
+                feitos, _ = wait(pendentes, timeout=atraso)
+                if not feitos:
+                    restante -= atraso
+                    pendentes.add(self._submeter(system, user, min(self.attempt_timeout_s, restante)))
+
+        fim = time.monotonic() + restante
+        erro = None
+        while pendentes:
+            feitos, pendentes = wait(pendentes, timeout=max(0.0, fim - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not feitos:
+                raise FuturesTimeout()
+            for fut in feitos:
+                if fut.exception() is None:
+                    return fut.result()
+                erro = fut.exception()
+        raise erro
+
+    def complete(self, system: str, user: str) -> str:
+        if not self.breaker.allow():
+            raise LLMIndisponivel("circuito aberto")
+
+        fim = time.monotonic() + self.deadline_s
+        ultimo_erro = None
+        registrado = False
+        try:
+            for tentativa in range(self.max_retries + 1):
+                restante = fim - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    texto = self._tentativa(system, user, restante)
+                    self.breaker.record_success()
+                    registrado = True
+                    return texto
+                except FuturesTimeout:
+                    self.breaker.record_failure()
+                    registrado = True
+                    raise LLMIndisponivel(f"deadline de {self.deadline_s}s estourado")
+                except Exception as e:
+                    if _falha_do_servico(e):
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    registrado = True
+                    if not _erro_retentavel(e):
+                        raise
+                    ultimo_erro = e
+                    if not self.breaker.allow():
+                        break
+                # backoff exponencial com "full jitter", sem passar do deadline
+                espera = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** tentativa))
+                time.sleep(max(0.0, min(espera, fim - time.monotonic())))
+        finally:
+            # a chamada de teste do half_open sempre decide o estado, mesmo saindo por exceção
+            if not registrado and self.breaker.state == "half_open":
+                self.breaker.record_failure()
+
+        raise LLMIndisponivel(f"LLM indisponível: {ultimo_erro!r}") from ultimo_erro
@@ -0,0 +1,167 @@
+"""
+Teste de carga: N sessões de chat simultâneas contra o pipeline, com um LLM stub local.
+
+Cada sessão roda numa thread (como o Streamlit faz), abre com uma pergunta sem prato
+(busca semântica no FAISS) e segue com follow-ups:
+    "O que é o <prato>?" -> "quanto custa? (mesa N)" -> "tem lactose?" -> "qual o modo de preparo? (mesa N)"
+e confere, a cada turno, se a resposta e o estado pertencem à própria sessão
+(prato atual, última pergunta, marcador da mesa). Qualquer divergência conta como cross-talk.
+
+Exemplo:
+    python load_test.py --sessions 50 --rounds 3 --llm-latency 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+
+# =====================
+# LLM STUB
+# =====================
+class StubLLMClient:
+    """
+    Imita o AzureOpenAI usado pelo pipeline (with_options + chat.completions.create).
+    Responde ecoando a pergunta recebida, para dar pra conferir de quem é a resposta.
+    """
+
+    def __init__(self, latency_s: float = 0.2, jitter_s: float = 0.05):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def with_options(self, **kwargs):
+        return self
+
+    def _create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls += 1
+        user = next((m["content"] for m in messages if m["role"] == "user"), "")
+        pergunta = user.split("\n\nCONTEXTO:")[0].replace("PERGUNTA:\n", "").strip()
+        time.sleep(max(0.0, random.gauss(self.latency_s, self.jitter_s)))
+        mensagem = SimpleNamespace(content=f"[stub] {pergunta}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=mensagem)])
+
+
+# =====================
+# SESSÃO
+# =====================
+def _roteiro(prato: str, mesa: int, abertura: bool):
+    # (pergunta, prato esperado no estado, texto que a resposta precisa conter)
+    turnos = [
+        (f"O que é o {prato}?", prato, prato),
+        (f"quanto custa? (mesa {mesa})", prato, prato),
+        ("tem lactose?", prato, prato),
+        (f"qual o modo de preparo? (mesa {mesa})", prato, f"(mesa {mesa})"),
+    ]
+    if abertura:
+        turnos.insert(0, (f"quais pratos levam queijo? (mesa {mesa})", None, f"(mesa {mesa})"))
+    return turnos
+
+
+def run_session(rag_pipeline, mesa: int, prato: str, rounds: int, think_time: float = 0.02):
+    latencias, problemas, erros = [], [], 0
+    state = {}
+    for rodada in range(rounds):
+        for pergunta, prato_esperado, esperado in _roteiro(prato, mesa, abertura=rodada == 0):
+            # tempo de "digitação" entre turnos: intercala as sessões
+            time.sleep(random.uniform(0, think_time))
+            anterior = dict(state)
+            inicio = time.perf_counter()
+            try:
+                r = rag_pipeline.answer_question(pergunta, state=state)
+            except Exception as e:
+                erros += 1
+                problemas.append(f"mesa {mesa}: erro em {pergunta!r}: {type(e).__name__}: {e}")
+                continue
+            latencias.append(time.perf_counter() - inicio)
+
+            novo = r["state"]
+            if state != anterior:
+                problemas.append(f"mesa {mesa}: state do chamador foi alterado")
+            if novo.get("current_dish") != prato_esperado or r.get("dish_title") != prato_esperado:
+                problemas.append(f"mesa {mesa}: prato {novo.get('current_dish')!r} / {r.get('dish_title')!r}, esperado {prato_esperado!r}")
+            if novo.get("last_user_question") != pergunta:
+                problemas.append(f"mesa {mesa}: última pergunta {novo.get('last_user_question')!r}")
+            if esperado not in r["text"]:
+                problemas.append(f"mesa {mesa}: resposta de {pergunta!r} sem {esperado!r}: {r['text'][:80]!r}")
+            state = novo
+    return latencias, problemas, erros
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+
+def run_load_test(sessions: int = 20, rounds: int = 3, llm_latency: float = 0.2, jitter: float = 0.05,
+                  think_time: float = 0.02):
+    import rag_pipeline
+
+    stub = StubLLMClient(llm_latency, jitter)
+    rag_pipeline.client = stub
+    pratos = rag_pipeline.listar_todos_pratos()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(run_session, rag_pipeline, mesa, pratos[mesa % len(pratos)], rounds, think_time)
+            for mesa in range(1, sessions + 1)
+        ]
+        resultados = [f.result() for f in futures]
+    duracao = time.perf_counter() - inicio
+
+    latencias = [l for r in resultados for l in r[0]]
+    problemas = [p for r in resultados for p in r[1]]
+    erros = sum(r[2] for r in resultados)
+    turnos = len(latencias) + erros
+
+    return {
+        "sessoes": sessions,
+        "turnos": turnos,
+        "erros": erros,
+        "cross_talk": len(problemas) - erros,
+        "segundos": round(duracao, 2),
+        "turnos_por_segundo": round(turnos / duracao, 1) if duracao else 0.0,
+        "latencia_ms": {
+            "p50": round(_percentil(latencias, 50) * 1000, 1),
+            "p95": round(_percentil(latencias, 95) * 1000, 1),
+            "p99": round(_percentil(latencias, 99) * 1000, 1),
+            "max": round(max(latencias, default=0.0) * 1000, 1),
+        },
+        "chamadas_llm": stub.calls,
+        "embeddings": rag_pipeline.embedding_metrics(),
+        "exemplos_de_problemas": problemas[:10],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga multi-sessão do pipeline RAG (LLM stub).")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=3, help="repetições do roteiro por sessão")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="latência média do stub, em segundos")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--think-time", type=float, default=0.02, help="pausa máxima entre turnos, em segundos")
+    args = parser.parse_args(argv)
+
+    # credenciais fictícias: o stub substitui o client, o Key Vault não é usado
+    for env, valor in [("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1"), ("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+                       ("AZURE_OPENAI_API_KEY", "stub"), ("AZURE_OPENAI_CHAT_DEPLOY", "stub")]:
+        os.environ.setdefault(env, valor)
+
+    resumo = run_load_test(args.sessions, args.rounds, args.llm_latency, args.jitter, args.think_time)
+    print(json.dumps(resumo, ensure_ascii=False, indent=2))
+    return 1 if resumo["erros"] or resumo["cross_talk"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
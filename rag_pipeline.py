@@ -1,15 +1,19 @@
 from pathlib import Path
 from datetime import datetime
+import os
 import re
+import threading
 import unicodedata
+from collections import OrderedDict
 
 import pandas as pd
 import faiss
 from sentence_transformers import SentenceTransformer
 from openai import AzureOpenAI
 
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
+from embedding_batcher import EMBED_TIMEOUT_S, EmbeddingBatcher, EmbeddingIndisponivel
+from llm_resilience import LLMIndisponivel, ResilientLLM, SingleFlight
+from secrets_loader import KeyVaultSecretProvider, SecretLoader
 
 # =====================
 # PATHS
@@ -24,26 +28,56 @@ assert RAG_CHUNKS_PATH.exists(), f"Arquivo não encontrado: {RAG_CHUNKS_PATH}"
 # =====================
 # AZURE KEY VAULT + OPENAI
 # =====================
-def load_azure_openai_from_keyvault():
-    KEY_VAULT_NAME = "kv-academy-01"
-    KV_URI = f"https://{KEY_VAULT_NAME}.vault.azure.net"
+KEY_VAULT_NAME = "kv-academy-01"
+KV_URI = f"https://{KEY_VAULT_NAME}.vault.azure.net"
+
+# segredo no Key Vault -> variável de ambiente que o sobrescreve
+AZURE_OPENAI_SECRETS = {
+    "URL-API-GPT": "AZURE_OPENAI_ENDPOINT",
+    "VERSION-API-GPT": "AZURE_OPENAI_API_VERSION",
+    "KEY-API-GPT": "AZURE_OPENAI_API_KEY",
+    "MODELO-APT-GPT": "AZURE_OPENAI_CHAT_DEPLOY",
+}
+
+# arquivo JSON opcional com {segredo ou variável de ambiente: valor}
+SECRETS_FILE = os.environ.get("RAG_SECRETS_FILE", "")
+# cache local dos segredos (vazio = só em memória); fica fora da pasta do projeto
+_USER_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "rag-chatbot-restaurante"
+SECRETS_CACHE_PATH = os.environ.get("RAG_SECRETS_CACHE", str(_USER_CACHE_DIR / "secrets_cache.json"))
+SECRETS_CACHE_TTL_S = float(os.environ.get("RAG_SECRETS_TTL_S", 15 * 60))
+# idade máxima de um valor vencido servido enquanto o refresh falha
+SECRETS_CACHE_MAX_STALE_S = float(os.environ.get("RAG_SECRETS_MAX_STALE_S", 24 * 60 * 60))
+
+
+def _build_azure_openai_client(segredos: dict):
+    client = AzureOpenAI(
+        api_key=segredos["KEY-API-GPT"],
+        api_version=segredos["VERSION-API-GPT"],
+        azure_endpoint=segredos["URL-API-GPT"],
+    )
+    return client, segredos["MODELO-APT-GPT"]
 
-    credential = DefaultAzureCredential()
-    kv_client = SecretClient(vault_url=KV_URI, credential=credential)
 
-    endpoint = kv_client.get_secret("URL-API-GPT").value
-    api_version = kv_client.get_secret("VERSION-API-GPT").value
-    api_key = kv_client.get_secret("KEY-API-GPT").value
-    deployment = kv_client.get_secret("MODELO-APT-GPT").value
+def _aplicar_segredos_rotacionados(segredos: dict):
+    # troca o client em uso quando a chave/endpoint rotaciona no Key Vault
+    global client, AZURE_OPENAI_CHAT_DEPLOY
+    client, AZURE_OPENAI_CHAT_DEPLOY = _build_azure_openai_client(segredos)
 
-    client = AzureOpenAI(
-        api_key=api_key,
-        api_version=api_version,
-        azure_endpoint=endpoint,
-    )
 
-    return client, deployment
+secret_loader = SecretLoader(
+    KeyVaultSecretProvider(KV_URI),
+    AZURE_OPENAI_SECRETS,
+    cache_path=SECRETS_CACHE_PATH,
+    ttl_s=SECRETS_CACHE_TTL_S,
+    secrets_file=SECRETS_FILE,
+    on_refresh=_aplicar_segredos_rotacionados,
+    max_stale_s=SECRETS_CACHE_MAX_STALE_S,
+)
+
 
+def load_azure_openai_from_keyvault(loader: SecretLoader | None = None):
+    segredos = (loader or secret_loader).load()
+    return _build_azure_openai_client(segredos)
 
 # inicializa uma única vez
 client, AZURE_OPENAI_CHAT_DEPLOY = load_azure_openai_from_keyvault()
@@ -98,38 +132,480 @@ else:
     rag_dataset["categoria_corr"] = rag_dataset["categoria_corr"].apply(normalizar_categoria)
 
 
+# =====================
+# FICHAS TÉCNICAS ESTRUTURADAS (extração na ingestão)
+# =====================
+# cabeçalho da ficha -> campo da tabela
+SECOES_FICHA = {
+    "CATEGORIA": "categoria_ficha",
+    "CHEF RESPONSAVEL": "chef",
+    "DESCRICAO": "descricao",
+    "INGREDIENTES": "ingredientes",
+    "MODO DE PREPARO": "modo_preparo",
+    "TEMPO MEDIO DE PREPARO": "tempo_preparo",
+    "RESTRICOES ALIMENTARES": "restricoes",
+    "SUGESTAO DE EMPRATAMENTO": "empratamento",
+    "HARMONIZACAO": "harmonizacao",
+    "CUSTO MEDIO": "custo",
+}
+
+# fichas "escaneadas" (ex.: PDF_015) usam rótulos em linha: "Tempo: 20 minutos | Restrições: ..."
+_SECOES_EM_LINHA = {
+    "ingredientes": r"(?im)^\s*INGREDIENTES\s*:\s*(.+)$",
+    "modo_preparo": r"(?ims)^\s*(?:MODO DE )?PREPARO\s*:\s*(.+?)(?=\n\s*Tempo\s*:|\Z)",
+    "tempo_preparo": r"(?im)\bTempo\s*:\s*([^|\n]+)",
+    "restricoes": r"(?im)\bRestri\w*\s*:\s*([^\n]+)",
+    "empratamento": r"(?im)^\s*Empratamento\s*:\s*([^\n]+)",
+    "harmonizacao": r"(?im)^\s*Harmoniza\w*\s*:\s*([^\n]+)",
+    "custo": r"(?im)^\s*Custo\w*\s*:\s*([^\n]+)",
+}
+
+
+def _juntar_chunks(chunks) -> str:
+    """
+    Reconstrói o texto do documento a partir dos chunks (que se sobrepõem).
+    """
+    texto = ""
+    for c in chunks:
+        c = str(c).strip()
+        if not c:
+            continue
+        if not texto:
+            texto = c
+            continue
+        # maior sufixo do texto acumulado que é prefixo do próximo chunk
+        overlap = 0
+        for k in range(min(len(texto), len(c)), 19, -1):
+            if texto.endswith(c[:k]):
+                overlap = k
+                break
+        texto = texto + ("" if overlap else "\n") + c[overlap:]
+    return texto
+
+
+def _eh_rodape(linha: str) -> bool:
+    n = _norm_text(linha)
+    return n.startswith("versao") or n.startswith("pagina")
+
+
+def _blocos_ficha(texto: str):
+    """
+    Quebra a ficha nos cabeçalhos conhecidos, na ordem em que aparecem.
+    Retorna [(cabeçalho, conteúdo)]; o rodapé "Versão: ... | Data: ..." vira um
+    bloco sem cabeçalho e "Página N" é descartado.
+    Fichas sem cabeçalhos (escaneadas) viram um bloco por linha.
+    """
+    blocos, atual, linhas = [], None, []
+
+    def fecha():
+        conteudo = " ".join(l.strip() for l in linhas).strip()
+        if atual is not None and conteudo:
+            blocos.append((atual, conteudo))
+
+    for linha in str(texto).splitlines():
+        cab = _strip_accents(linha.strip()).upper()
+        if cab in SECOES_FICHA:
+            fecha()
+            atual, linhas = linha.strip(), []
+        elif _eh_rodape(linha):
+            fecha()
+            atual, linhas = None, []
+            if _norm_text(linha).startswith("versao"):
+                blocos.append(("", linha.strip()))
+        elif atual is not None:
+            linhas.append(linha)
+    fecha()
+
+    if not any(cab for cab, _ in blocos):
+        blocos = [("", l.strip()) for l in str(texto).splitlines() if l.strip() and not _eh_rodape(l)]
+    return blocos
+
+
+def separar_secoes_ficha(texto: str) -> dict:
+    """
+    Separa o texto da ficha pelos cabeçalhos conhecidos (INGREDIENTES, CUSTO MÉDIO...).
+    Retorna {campo: conteúdo}; campos ausentes não aparecem.
+    """
+    secoes = {
+        SECOES_FICHA[_strip_accents(cab).upper()]: conteudo
+        for cab, conteudo in _blocos_ficha(texto) if cab
+    }
+
+    for campo, padrao in _SECOES_EM_LINHA.items():
+        if campo not in secoes:
+            m = re.search(padrao, texto)
+            if m:
+                secoes[campo] = re.sub(r"\s+", " ", m.group(1)).strip()
+    return secoes
+
+
+def _contar_tokens_aprox(texto: str) -> int:
+    return len(re.findall(r"\w+|[^\w\s]", texto))
+
+
+def chunk_ficha_por_secoes(texto: str, titulo: str, categoria: str = "",
+                           max_tokens: int = 254, count_tokens=None):
+    """
+    Chunking por seções da ficha (em vez de fatiar caracteres com overlap).
+    Junta seções inteiras até `max_tokens`; só quebra uma seção (por frases)
+    se ela sozinha não couber. Todo chunk começa com "título | Categoria: X".
+    Retorna [(texto_do_chunk, [cabeçalhos])].
+    """
+    count_tokens = count_tokens or _contar_tokens_aprox
+    cabecalho = f"{titulo} | Categoria: {categoria}" if categoria else str(titulo)
+    orcamento = max_tokens - count_tokens(cabecalho)
+
+    # 1) blocos que cabem no orçamento (seções grandes são divididas por frase)
+    pedacos = []
+    for cab, conteudo in _blocos_ficha(texto):
+        bloco = f"{cab}\n{conteudo}" if cab else conteudo
+        if count_tokens(bloco) <= orcamento:
+            pedacos.append((cab, bloco))
+            continue
+        atual = []
+        for frase in re.split(r"(?<=[.!?])\s+", conteudo):
+            candidato = " ".join(atual + [frase])
+            if atual and count_tokens(f"{cab}\n{candidato}") > orcamento:
+                pedacos.append((cab, f"{cab}\n{' '.join(atual)}" if cab else " ".join(atual)))
+                atual = []
+            atual.append(frase)
+        if atual:
+            pedacos.append((cab, f"{cab}\n{' '.join(atual)}" if cab else " ".join(atual)))
+
+    # 2) empacota seções consecutivas
+    chunks, atual, cabs = [], [], []
+    for cab, bloco in pedacos:
+        if atual and count_tokens("\n".join([cabecalho] + atual + [bloco])) > max_tokens:
+            chunks.append(("\n".join([cabecalho] + atual), cabs))
+            atual, cabs = [], []
+        atual.append(bloco)
+        if cab and cab not in cabs:
+            cabs.append(cab)
+    if atual:
+        chunks.append(("\n".join([cabecalho] + atual), cabs))
+    return chunks
+
+
+def rechunk_por_secoes(df, max_tokens: int = 254, count_tokens=None):
+    """
+    Refaz os chunks dos PDFs por seção, a partir do texto reconstruído de cada documento.
+    Linhas que não são PDF passam sem alteração.
+    """
+    linhas = []
+    for doc_id, grupo in df.groupby("document_id", sort=False):
+        primeira = grupo.iloc[0].to_dict()
+        if str(primeira.get("tipo", "")).lower() != "pdf":
+            linhas.extend(grupo.to_dict("records"))
+            continue
+
+        texto = _juntar_chunks(grupo.sort_values("chunk_id")["chunks"].fillna(""))
+        chunks = chunk_ficha_por_secoes(
+            texto, primeira["titulo"], primeira.get("categoria_corr", ""),
+            max_tokens=max_tokens, count_tokens=count_tokens,
+        )
+        for i, (chunk, cabs) in enumerate(chunks, start=1):
+            linhas.append({**primeira, "chunk_id": i, "chunks": chunk, "secoes": ", ".join(cabs)})
+
+    return pd.DataFrame(linhas, columns=list(dict.fromkeys(list(df.columns) + ["secoes"]))).reset_index(drop=True)
+
+
+def _parse_minutos(s):
+    n = _norm_text(s)
+    m = re.search(r"(\d+)\s*h(?:ora|oras)?\b\s*(\d+)?", n) or re.search(r"(\d+)\s*h(\d+)", n)
+    if m:
+        return int(m.group(1)) * 60 + int(m.group(2) or 0)
+    m = re.search(r"(\d+)\s*min", n)
+    return int(m.group(1)) if m else None
+
+
+def _parse_faixa_preco(s):
+    valores = [float(v.replace(",", ".")) for v in re.findall(r"\d+(?:[.,]\d+)?", str(s or ""))]
+    if not valores:
+        return None, None
+    return min(valores), max(valores)
+
+
+def _flags_restricoes(s) -> dict:
+    n = _norm_text(s)
+    vegano = "vegan" in n
+    return {
+        "vegano": vegano,
+        "contem_lactose": "contem lactose" in n,
+        "sem_gluten": "sem gluten" in n,
+        "contem_gluten": "contem gluten" in n,
+        "contem_ovo": "contem ovo" in n,
+    }
+
+
+def _build_fichas():
+    df_pdf = rag_dataset[rag_dataset["tipo"].astype(str).str.lower() == "pdf"]
+    registros = []
+    for doc_id, grupo in df_pdf.sort_values("chunk_id").groupby("document_id", sort=True):
+        titulo = str(grupo["titulo"].iloc[0]).strip()
+        secoes = separar_secoes_ficha(_juntar_chunks(grupo["chunks"].fillna("")))
+        preco_min, preco_max = _parse_faixa_preco(secoes.get("custo"))
+        registros.append({
+            "document_id": doc_id,
+            "titulo": titulo,
+            "titulo_norm": _norm_text(titulo),
+            "categoria": grupo["categoria_corr"].iloc[0],
+            **{campo: secoes.get(campo) for campo in SECOES_FICHA.values()},
+            "tempo_min": _parse_minutos(secoes.get("tempo_preparo")),
+            "preco_min": preco_min,
+            "preco_max": preco_max,
+            **_flags_restricoes(secoes.get("restricoes")),
+        })
+
+    fichas = pd.DataFrame(registros)
+    fichas["tempo_min"] = fichas["tempo_min"].astype("Int64")
+    fichas["preco_min"] = fichas["preco_min"].astype("float64")
+    fichas["preco_max"] = fichas["preco_max"].astype("float64")
+    return fichas
+
+
+fichas_df = _build_fichas()
+# acesso O(1) por título normalizado (respostas determinísticas)
+FICHAS_POR_TITULO = {r["titulo_norm"]: r for r in fichas_df.to_dict("records")}
+
+
+def filtrar_fichas(categoria=None, sem_gluten=False, sem_lactose=False, vegano=False,
+                   preco_max=None, tempo_max=None):
+    """
+    Filtro vetorizado sobre a tabela de fichas.
+    Ex.: filtrar_fichas("Sobremesa", sem_gluten=True, preco_max=30)
+    """
+    mask = pd.Series(True, index=fichas_df.index)
+    if categoria:
+        mask &= fichas_df["categoria"] == categoria
+    if sem_gluten:
+        mask &= fichas_df["sem_gluten"]
+    if sem_lactose:
+        mask &= ~fichas_df["contem_lactose"]
+    if vegano:
+        mask &= fichas_df["vegano"]
+    if preco_max is not None:
+        mask &= fichas_df["preco_max"].le(preco_max).fillna(False)
+    if tempo_max is not None:
+        mask &= fichas_df["tempo_min"].le(tempo_max).fillna(False).astype(bool)
+    return fichas_df[mask].sort_values("titulo")
+
+
 # =====================
 # EMBEDDINGS + FAISS VECTOR STORE
 # =====================
 model_st = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
 
-texts = rag_dataset["chunks"].fillna("").astype(str).tolist()
+# chunks por seção, limitados ao que o modelo realmente lê (o resto seria truncado)
+MAX_TOKENS_CHUNK = getattr(model_st, "max_seq_length", 256) - 2
+
+def _contar_tokens_modelo(texto: str) -> int:
+    return len(model_st.tokenizer.tokenize(texto))
 
-embeddings = model_st.encode(
-    texts,
-    convert_to_numpy=True,
-    normalize_embeddings=True,
-).astype("float32")
+rag_dataset = rechunk_por_secoes(rag_dataset, max_tokens=MAX_TOKENS_CHUNK, count_tokens=_contar_tokens_modelo)
+
+# =====================
+# DEDUPLICAÇÃO NA CONSTRUÇÃO DO ÍNDICE
+# =====================
+DEDUP_SIM_THRESHOLD = 0.97   # cosseno a partir do qual dois chunks contam como o mesmo texto
+
+
+def _ref_chunk(r) -> str:
+    return f"{r['document_id']}:{r['chunk_id']}"
+
+
+def deduplicar_chunks(df, encode, limiar: float = DEDUP_SIM_THRESHOLD):
+    """
+    Tira do índice chunks vazios, cópias exatas (texto normalizado) e
+    quase-duplicados (cosseno >= limiar entre embeddings).
+    Entre cópias fica o PDF de confiança alta; ele guarda em `fontes` todos os
+    "document_id:chunk_id" que representa.
+    Retorna (df_indexado, embeddings, relatorio).
+    """
+    df = df.reset_index(drop=True)
+    textos = df["chunks"].fillna("").astype(str)
+    norm = textos.apply(_norm_text)
+
+    # PDF antes de imagem, confiança alta antes de média (ordem estável)
+    prioridade = (
+        (df["tipo"].astype(str).str.lower() != "pdf").astype(int) * 2
+        + (df["nivel_confianca"].astype(str).str.lower() != "alto").astype(int)
+    )
+    ordem = [i for i in prioridade.sort_values(kind="stable").index if norm[i]]
+    n_vazios = len(df) - len(ordem)
+
+    # 1) cópias exatas: nem chegam a ser codificadas
+    representante, grupos = {}, {}
+    for i in ordem:
+        rep = representante.setdefault(norm[i], i)
+        grupos.setdefault(rep, []).append(i)
+    unicos = list(grupos)
+    n_exatos = len(ordem) - len(unicos)
+
+    emb = encode(textos[unicos].tolist())
+
+    # 2) quase-duplicados: vizinhos por similaridade no próprio conjunto
+    tmp = faiss.IndexFlatIP(emb.shape[1])
+    tmp.add(emb)
+    lims, _, vizinhos = tmp.range_search(emb, limiar)
+
+    pos_de = {i: p for p, i in enumerate(unicos)}
+    absorvido_por = {}
+    for pos, i in enumerate(unicos):
+        if i in absorvido_por:
+            continue
+        for v in vizinhos[lims[pos]:lims[pos + 1]]:
+            # só absorve quem vem depois na ordem de prioridade
+            if v > pos and unicos[v] not in absorvido_por:
+                absorvido_por[unicos[v]] = i
+
+    mantidos = [i for i in unicos if i not in absorvido_por]
+    for j, i in absorvido_por.items():
+        grupos[i].extend(grupos[j])
+
+    df_idx = df.loc[mantidos].copy()
+    df_idx["fontes"] = [[_ref_chunk(df.loc[k]) for k in grupos[i]] for i in mantidos]
+    df_idx = df_idx.reset_index(drop=True)
+    emb_idx = emb[[pos_de[i] for i in mantidos]]
+
+    relatorio = {
+        "chunks": len(df),
+        "vazios": n_vazios,
+        "duplicados_exatos": n_exatos,
+        "quase_duplicados": len(absorvido_por),
+        "vetores_indexados": len(mantidos),
+        "vetores_removidos": len(df) - len(mantidos),
+        "limiar": limiar,
+    }
+    return df_idx, emb_idx, relatorio
+
+
+def relatorio_dedup() -> str:
+    r = DEDUP_REPORT
+    return (
+        f"Índice: {r['chunks']} chunks -> {r['vetores_indexados']} vetores "
+        f"({r['vetores_removidos']} removidos: {r['vazios']} vazios, "
+        f"{r['duplicados_exatos']} cópias exatas, {r['quase_duplicados']} quase-duplicados "
+        f"com cosseno >= {r['limiar']})"
+    )
+
+
+# o tokenizer "fast" do HuggingFace não aceita uso simultâneo ("Already borrowed"):
+# só o encode é serializado; FAISS (busca) e pandas (leitura) são seguros entre threads
+_model_lock = threading.Lock()
+
+
+def _encode_chunks(textos):
+    return model_st.encode(
+        textos,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype("float32")
+
+
+# index_dataset: linhas alinhadas com os vetores do FAISS (rag_dataset continua completo)
+index_dataset, embeddings, DEDUP_REPORT = deduplicar_chunks(rag_dataset, _encode_chunks)
 
 dim = embeddings.shape[1]
 index = faiss.IndexFlatIP(dim)
 index.add(embeddings)
 
+# =====================
+# MICRO-BATCHING DOS EMBEDDINGS DE PERGUNTAS (ver embedding_batcher.py)
+# =====================
+def _encode_queries(textos, lock_timeout_s: float | None = None):
+    # com lock_timeout_s, desiste se o modelo estiver preso em outro encode
+    if not _model_lock.acquire(timeout=-1 if lock_timeout_s is None else lock_timeout_s):
+        raise EmbeddingIndisponivel(f"modelo de embeddings ocupado há mais de {lock_timeout_s}s")
+    try:
+        return model_st.encode(
+            textos,
+            batch_size=len(textos),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+        ).astype("float32")
+    finally:
+        _model_lock.release()
+
+
+query_embedder = EmbeddingBatcher(
+    _encode_queries,
+    fallback_encode=lambda textos: _encode_queries(textos, lock_timeout_s=EMBED_TIMEOUT_S),
+)
+
+
+def embedding_metrics() -> dict:
+    """Profundidade da fila e tamanhos de lote do micro-batching de embeddings."""
+    return query_embedder.metrics()
+
+
 # =====================
 # RETRIEVAL FUNCTIONS
 # =====================
+# cache (pergunta, top_k) -> hits; preenchido também em lote por retrieve_faiss_batch
+RETRIEVAL_CACHE_SIZE = 2048
+_retrieval_cache = OrderedDict()
+_retrieval_cache_lock = threading.Lock()
+
+def _cache_retrieval_get(key):
+    with _retrieval_cache_lock:
+        hits = _retrieval_cache.get(key)
+        if hits is not None:
+            _retrieval_cache.move_to_end(key)
+    return None if hits is None else hits.copy()
+
+def _cache_retrieval_put(key, hits):
+    with _retrieval_cache_lock:
+        _retrieval_cache[key] = hits
+        _retrieval_cache.move_to_end(key)
+        while len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+            _retrieval_cache.popitem(last=False)
+
+
+def _hits_from_search(scores_row, idx_row):
+    hits = index_dataset.iloc[idx_row].copy()
+    hits["score"] = scores_row
+    return hits.sort_values("score", ascending=False)
+
+
 def retrieve_faiss(query: str, top_k: int = 10):
-    q = model_st.encode(
-        [query],
-        convert_to_numpy=True,
-        normalize_embeddings=True,
-    ).astype("float32")
+    """Busca semântica no FAISS. Levanta EmbeddingIndisponivel se o modelo não atender a tempo."""
+    cached = _cache_retrieval_get((query, top_k))
+    if cached is not None:
+        return cached
 
-    scores, idx = index.search(q, top_k)
+    # sob concorrência, o encode é agrupado com o de outras sessões
+    q = query_embedder.encode(query)
 
-    hits = rag_dataset.iloc[idx[0]].copy()
-    hits["score"] = scores[0]
-    return hits.sort_values("score", ascending=False)
+    scores, idx = index.search(q, min(top_k, index.ntotal))
+
+    hits = _hits_from_search(scores[0], idx[0])
+    _cache_retrieval_put((query, top_k), hits)
+    return hits.copy()
+
+
+def retrieve_faiss_batch(queries, top_k: int = 10, batch_size: int = 64):
+    """
+    Versão em lote do retrieve_faiss: um encode e um index.search por lote.
+    Os resultados ficam no cache, então answer_question reaproveita a busca.
+    """
+    resultados = []
+    for i in range(0, len(queries), batch_size):
+        lote = [str(q) for q in queries[i:i + batch_size]]
+        with _model_lock:
+            q = model_st.encode(
+                lote,
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+            ).astype("float32")
+
+        scores, idx = index.search(q, min(top_k, index.ntotal))
+
+        for j, query in enumerate(lote):
+            hits = _hits_from_search(scores[j], idx[j])
+            _cache_retrieval_put((query, top_k), hits)
+            resultados.append(hits.copy())
+    return resultados
 
 
 def retrieve_by_dish_title(dish_title: str, top_k: int = 8):
@@ -337,6 +813,133 @@ def eh_followup_sem_prato(pergunta: str) -> bool:
     ]
     return any(g in p for g in gatilhos) and (encontrar_prato_na_pergunta(pergunta) is None)
 
+# campo da ficha -> gatilhos (regex sobre o texto normalizado)
+GATILHOS_CAMPOS_FICHA = {
+    # "valor" só com contexto de preço: "qual o valor?", "valor do prato"; não "valor nutricional"
+    "preco": [r"preco", r"quanto custa", r"custo", r"\bvalor(?:$|\s+(?:d[oae]s?|dele|dela|desse|dessa|deste|desta|em reais)\b)"],
+    "tempo": [r"tempo", r"demora"],
+    "lactose": [r"lactose"],
+    "gluten": [r"gluten"],
+    "restricoes": [r"restricao", r"restricoes", r"vegan", r"alerg"],
+    # "bebida"/"beber" só quando é sobre acompanhar o prato: não "vocês têm bebida sem álcool?"
+    "harmonizacao": [r"harmoniza", r"\bcombina\b", r"\bbebida\b.*\b(?:combin|acompanh|indica|recomend|suger)", r"\bbeber com\b"],
+}
+
+# perguntas abertas continuam indo pro LLM
+_GATILHOS_PERGUNTA_ABERTA = ["ingrediente", "modo de preparo", "como prepara", "como faz", "receita", "descri"]
+
+def detectar_campos_ficha(pergunta: str) -> list:
+    p = _norm_text(pergunta)
+    if any(g in p for g in _GATILHOS_PERGUNTA_ABERTA):
+        return []
+    return [campo for campo, gatilhos in GATILHOS_CAMPOS_FICHA.items() if any(re.search(g, p) for g in gatilhos)]
+
+def campos_ficha_de_um_prato(pergunta: str) -> list:
+    """
+    Campos da ficha pedidos numa pergunta sobre um único prato (o citado ou o atual
+    da conversa). Perguntas sobre uma categoria ou sobre vários pratos
+    ("quais pratos têm lactose?") retornam [] e seguem para os outros intents.
+    """
+    p = _norm_text(pergunta)
+    if extrair_categoria_da_pergunta(pergunta) is not None:
+        return []
+    if re.search(r"\b(?:pratos|itens|opcoes|cardapio|liste|listar|algum|alguma|todos|todas)\b", p):
+        return []
+    return detectar_campos_ficha(pergunta)
+
+def extrair_filtros_da_pergunta(pergunta: str) -> dict:
+    """
+    Ex.: "sobremesas sem glúten até R$ 30" ->
+    {"categoria": "Sobremesa", "sem_gluten": True, "preco_max": 30.0}
+    """
+    p = _norm_text(pergunta)
+    filtros = {}
+
+    cat = extrair_categoria_da_pergunta(pergunta)
+    if cat:
+        filtros["categoria"] = cat
+    if "sem gluten" in p:
+        filtros["sem_gluten"] = True
+    if "sem lactose" in p:
+        filtros["sem_lactose"] = True
+    if "vegan" in p:
+        filtros["vegano"] = True
+
+    for m in re.finditer(r"(?:ate|menos de|no maximo|abaixo de)\s+(r\s+)?(\d+)\s*(reais|minutos|min|horas|hora|h)?\b", p):
+        valor, unidade = int(m.group(2)), m.group(3) or ""
+        if unidade.startswith("h"):
+            filtros["tempo_max"] = valor * 60
+        elif unidade.startswith("min"):
+            filtros["tempo_max"] = valor
+        elif m.group(1) or unidade == "reais" or "preco" in p or "custa" in p:
+            filtros["preco_max"] = float(valor)
+    return filtros
+
+def eh_pergunta_filtro_cardapio(pergunta: str) -> bool:
+    filtros = extrair_filtros_da_pergunta(pergunta)
+    restricoes = {"sem_gluten", "sem_lactose", "vegano", "preco_max", "tempo_max"} & set(filtros)
+    if not restricoes or encontrar_prato_na_pergunta(pergunta) is not None:
+        return False
+    # sem categoria/limite, só é listagem se a pergunta pedir várias opções
+    p = _norm_text(pergunta)
+    pede_lista = any(k in p for k in ["quais", "liste", "listar", "opcoes", "pratos", "itens"])
+    return pede_lista or bool({"categoria", "preco_max", "tempo_max"} & set(filtros))
+
+def resposta_campos_ficha(prato: str, campos: list):
+    ficha = FICHAS_POR_TITULO.get(_norm_text(prato))
+    if ficha is None:
+        return None
+
+    linhas = []
+    for campo in campos:
+        if campo == "preco" and ficha["custo"]:
+            linhas.append(f"O custo médio do prato **{prato}** é **{ficha['custo']}**.")
+        elif campo == "tempo" and ficha["tempo_preparo"]:
+            linhas.append(f"O tempo médio de preparo do prato **{prato}** é **{ficha['tempo_preparo']}**.")
+        elif campo == "lactose" and ficha["restricoes"]:
+            if ficha["contem_lactose"]:
+                linhas.append(f"Sim, o prato **{prato}** contém lactose.")
+            elif ficha["vegano"]:
+                linhas.append(f"Não, o prato **{prato}** é vegano (sem lactose).")
+            else:
+                linhas.append(f"A ficha técnica do prato **{prato}** não indica lactose (restrições: {ficha['restricoes']}).")
+        elif campo == "gluten" and ficha["restricoes"]:
+            if ficha["contem_gluten"]:
+                linhas.append(f"Sim, o prato **{prato}** contém glúten.")
+            elif ficha["sem_gluten"]:
+                linhas.append(f"Não, o prato **{prato}** é sem glúten.")
+            else:
+                linhas.append(f"A ficha técnica do prato **{prato}** não indica glúten (restrições: {ficha['restricoes']}).")
+        elif campo == "restricoes" and ficha["restricoes"]:
+            linhas.append(f"Restrições alimentares do prato **{prato}**: {ficha['restricoes']}.")
+        elif campo == "harmonizacao" and ficha["harmonizacao"]:
+            linhas.append(f"Sugestão de harmonização para **{prato}**: {ficha['harmonizacao']}.")
+
+    # algum campo sem dado na ficha => deixa o RAG responder
+    if len(linhas) != len(campos):
+        return None
+    return "\n".join(linhas)
+
+def resposta_filtro_cardapio(filtros: dict) -> str:
+    pratos = filtrar_fichas(**filtros)
+
+    descricao = []
+    if filtros.get("categoria"): descricao.append(f"categoria {filtros['categoria']}")
+    if filtros.get("sem_gluten"): descricao.append("sem glúten")
+    if filtros.get("sem_lactose"): descricao.append("sem lactose")
+    if filtros.get("vegano"): descricao.append("veganos")
+    if filtros.get("preco_max") is not None: descricao.append(f"até R$ {filtros['preco_max']:.0f}")
+    if filtros.get("tempo_max") is not None: descricao.append(f"até {filtros['tempo_max']} minutos de preparo")
+    criterio = ", ".join(descricao)
+
+    if pratos.empty:
+        return f"Não encontrei pratos ({criterio}) na base atual."
+
+    itens = [f"{r.titulo} ({r.custo or 'custo não informado'})" for r in pratos.itertuples()]
+    texto = f"Pratos ({criterio}):\n- " + "\n- ".join(itens)
+    texto += f"\n\nTotal: {len(itens)} pratos."
+    return texto
+
 def meta_answer(query: str, state: dict):
     q = query.lower().strip()
     if "que dia é hoje" in q or "data de hoje" in q:
@@ -351,6 +954,86 @@ def meta_answer(query: str, state: dict):
     return None
 
 
+# =====================
+# COALESCÊNCIA DE CHAMADAS AO LLM (single-flight, ver llm_resilience.py)
+# =====================
+_llm_em_voo = SingleFlight()
+
+def _chave_llm(query: str, context: str):
+    # mesma pergunta (normalizada) + mesmo contexto recuperado => mesma resposta
+    return (_norm_text(query), context)
+
+
+# limitador opcional de tokens/minuto (ex.: batch_answer.TokenRateLimiter)
+_llm_rate_limiter = None
+
+def set_llm_rate_limiter(limiter):
+    """
+    Instala um objeto com `acquire(n_tokens)` chamado uma vez por pergunta, antes
+    do deadline do LLM começar a contar. Use None para remover.
+    """
+    global _llm_rate_limiter
+    _llm_rate_limiter = limiter
+
+
+def _estimar_tokens(*textos, max_resposta: int = 400) -> int:
+    # aproximação grosseira (~4 caracteres por token) + orçamento da resposta
+    return sum(len(t) for t in textos) // 4 + max_resposta
+
+
+def _chat_completion(system: str, user: str, timeout: float | None = None) -> str:
+    # retries ficam por conta do ResilientLLM
+    resp = client.with_options(timeout=timeout, max_retries=0).chat.completions.create(
+        model=AZURE_OPENAI_CHAT_DEPLOY,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        temperature=0.2,
+    )
+    return resp.choices[0].message.content
+
+
+# =====================
+# CLIENTE LLM RESILIENTE (ver llm_resilience.py)
+# =====================
+llm = ResilientLLM(lambda system, user, timeout: _chat_completion(system, user, timeout=timeout))
+
+
+def _llm_completar(system: str, user: str) -> str:
+    # a espera pelo orçamento de tokens fica fora do deadline: fila de rate limit não é lentidão do LLM
+    limiter = _llm_rate_limiter
+    if limiter is not None:
+        limiter.acquire(_estimar_tokens(system, user))
+    return llm.complete(system, user)
+
+
+# =====================
+# RESPOSTA EXTRATIVA (fallback sem LLM)
+# =====================
+def resposta_extrativa(query: str, hits, max_trechos: int = 3) -> str:
+    """
+    Resposta rápida montada com os trechos dos chunks recuperados que mais
+    compartilham palavras com a pergunta. Usada quando o LLM não responde a tempo.
+    """
+    termos = {t for t in _norm_text(query).split() if len(t) > 2}
+    candidatos = []
+    for ordem, r in enumerate(hits.itertuples()):
+        for trecho in re.split(r"(?<=[.!?])\s+|\n+", str(r.chunks)):
+            trecho = trecho.strip()
+            if len(trecho) < 15:
+                continue
+            score = len(termos & set(_norm_text(trecho).split()))
+            candidatos.append((score, -ordem, trecho))
+
+    melhores = [t for s, _, t in sorted(candidatos, reverse=True)[:max_trechos] if s > 0]
+    if not melhores:
+        melhores = [t for _, _, t in candidatos[:max_trechos]]
+
+    texto = "No momento não consegui gerar uma resposta completa. Trechos das fichas técnicas que podem ajudar:\n- "
+    return texto + "\n- ".join(melhores)
+
+
 # =====================
 # MAIN RAG FUNCTION
 # =====================
@@ -362,9 +1045,14 @@ def answer_question(query: str, state: dict | None = None, top_k: int = 10, min_
       - dish_title: prato identificado (ou None)
       - dish_image: caminho da imagem (ou None)
       - state: estado atualizado (memória)
+      - fallback: True quando o LLM (ou o modelo de embeddings) não respondeu a tempo
+        e o texto é uma resposta de contingência
+
+    Pode ser chamada de várias threads ao mesmo tempo (uma por sessão do Streamlit).
+    O `state` recebido não é alterado: a função trabalha numa cópia e devolve
+    o estado novo em "state".
     """
-    if state is None:
-        state = {}
+    state = dict(state) if state else {}
 
     # registra última pergunta
     state["last_user_question"] = query
@@ -382,6 +1070,8 @@ def answer_question(query: str, state: dict | None = None, top_k: int = 10, min_
         }
     
     dish_mentioned = False
+    # calculado antes de a pergunta ganhar o prefixo "Sobre o prato ..."
+    campos_ficha = campos_ficha_de_um_prato(query)
 
     # detecta prato na pergunta
     tnorm = encontrar_prato_na_pergunta(query)
@@ -397,6 +1087,33 @@ def answer_question(query: str, state: dict | None = None, top_k: int = 10, min_
 
     dish_image = get_image_path_for_dish(prato_atual) if prato_atual else None
 
+    # 0) Filtros estruturados (ex.: "sobremesas sem glúten até R$ 30")
+    if eh_pergunta_filtro_cardapio(query):
+        filtros = extrair_filtros_da_pergunta(query)
+        return {
+            "text": resposta_filtro_cardapio(filtros),
+            "sources": ["rag_dataset_chunks.csv (fichas técnicas estruturadas)"],
+            "dish_title": None,
+            "dish_image": None,
+            "show_image": False,
+            "state": state
+        }
+
+    # 0.5) Preço / tempo / restrições / harmonização do prato atual (sem LLM)
+    # só quando a pergunta é sobre esse prato (citado ou follow-up), não sobre uma categoria ou lista
+    if prato_atual and campos_ficha:
+        texto = resposta_campos_ficha(prato_atual, campos_ficha)
+        if texto is not None:
+            ficha = FICHAS_POR_TITULO[_norm_text(prato_atual)]
+            return {
+                "text": texto,
+                "sources": [f"{ficha['document_id']} (ficha técnica: {prato_atual})"],
+                "dish_title": prato_atual,
+                "dish_image": dish_image,
+                "show_image": dish_mentioned,
+                "state": state
+            }
+
     # 1) Listar pratos por categoria
     if eh_pergunta_listar_itens_categoria(query):
         cat = extrair_categoria_da_pergunta(query)
@@ -496,7 +1213,19 @@ def answer_question(query: str, state: dict | None = None, top_k: int = 10, min_
 
     # B) Se não achou por título, cai no FAISS (busca semântica normal)
     if hits.empty:
-        hits = retrieve_faiss(query, top_k=top_k)
+        try:
+            hits = retrieve_faiss(query, top_k=top_k)
+        except EmbeddingIndisponivel:
+            # modelo de embeddings travado: responde na hora e deixa a pergunta ser refeita
+            return {
+                "text": "No momento não consegui consultar as fichas técnicas. Tente novamente em instantes.",
+                "sources": [],
+                "dish_title": prato_atual,
+                "dish_image": dish_image,
+                "show_image": dish_mentioned,
+                "state": state,
+                "fallback": True
+            }
 
         # threshold só faz sentido no FAISS
         hits = hits[hits["score"] >= min_score]
@@ -508,7 +1237,7 @@ def answer_question(query: str, state: dict | None = None, top_k: int = 10, min_
                 hits = hits_prato.copy()
 
     # reduz poluição
-    hits = hits.drop_duplicates(subset=["document_id"]).head(5)
+    hits = hits.drop_duplicates(subset=["document_id", "chunk_id"]).head(5)
 
     if hits.empty:
         return {
@@ -532,22 +1261,32 @@ def answer_question(query: str, state: dict | None = None, top_k: int = 10, min_
 
     user = f"PERGUNTA:\n{query}\n\nCONTEXTO:\n{context}"
 
-    resp = client.chat.completions.create(
-        model=AZURE_OPENAI_CHAT_DEPLOY,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user},
-        ],
-        temperature=0.2,
-    )
-
-    sources = [f"{r.document_id} (chunk {r.chunk_id})" for r in hits.itertuples()]
+    # perguntas idênticas em paralelo (horário de pico) compartilham uma única chamada
+    fallback = False
+    try:
+        texto = _llm_em_voo.do(
+            _chave_llm(query, context),
+            lambda: _llm_completar(system, user),
+        )
+    except LLMIndisponivel:
+        # LLM lento/fora do ar: resposta extrativa imediata, dentro do SLO
+        texto = resposta_extrativa(query, hits)
+        fallback = True
+
+    sources = []
+    for r in hits.itertuples():
+        fonte = f"{r.document_id} (chunk {r.chunk_id})"
+        copias = [f for f in (getattr(r, "fontes", None) or []) if f != f"{r.document_id}:{r.chunk_id}"]
+        if copias:
+            fonte += f" | também em: {', '.join(copias)}"
+        sources.append(fonte)
 
     return {
-        "text": resp.choices[0].message.content,
+        "text": texto,
         "sources": sources,
         "dish_title": prato_atual,
         "dish_image": dish_image,
         "show_image": dish_mentioned,
-        "state": state
+        "state": state,
+        "fallback": fallback
     }
\ No newline at end of file
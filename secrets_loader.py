@@ -0,0 +1,181 @@
+"""
+Carregamento de segredos (Azure Key Vault) com overrides por variável de ambiente
+ou arquivo, busca em paralelo e cache local com TTL renovado em background.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from azure.identity import DefaultAzureCredential
+from azure.keyvault.secrets import SecretClient
+
+
+class KeyVaultSecretProvider:
+    """
+    Lê segredos do Azure Key Vault. A credencial (DefaultAzureCredential) só é
+    criada na primeira leitura, então quem usa override/cache não paga por ela.
+    """
+
+    def __init__(self, vault_url: str):
+        self.vault_url = vault_url
+        self._kv_client = None
+        self._lock = threading.Lock()
+
+    def get_secret(self, name: str) -> str:
+        with self._lock:
+            if self._kv_client is None:
+                self._kv_client = SecretClient(vault_url=self.vault_url, credential=DefaultAzureCredential())
+        return self._kv_client.get_secret(name).value
+
+
+class SecretLoader:
+    """
+    Carrega segredos nesta ordem:
+      1) variáveis de ambiente / arquivo de override (nunca vão ao Key Vault)
+      2) cache local dentro do TTL
+      3) cache vencido há menos de `max_stale_s`: devolve o valor antigo e atualiza em background
+      4) sem cache: busca no provider, todos os segredos em paralelo
+    Com cache ativo, uma thread daemon re-busca a cada TTL e chama `on_refresh`
+    quando algum valor muda (rotação de chave).
+
+    `provider` é qualquer objeto com `get_secret(nome)` (str ou objeto com `.value`),
+    o que permite testar com um provider falso. Só o KeyVaultSecretProvider usa o
+    cache em disco, que fica marcado com a URL do cofre; os demais ficam só em memória.
+    `clock` (padrão: time.time) permite controlar o tempo nos testes.
+    """
+
+    def __init__(self, provider, secrets: dict, cache_path: str = "", ttl_s: float = 900.0,
+                 secrets_file: str = "", on_refresh=None, max_stale_s: float = 24 * 60 * 60,
+                 clock=time.time):
+        self.provider = provider
+        self.secrets = secrets
+        self._origem = provider.vault_url if isinstance(provider, KeyVaultSecretProvider) else None
+        self.cache_path = Path(cache_path) if cache_path and self._origem else None
+        self.ttl_s = ttl_s
+        self.max_stale_s = max_stale_s
+        self._clock = clock
+        self.secrets_file = secrets_file
+        self.on_refresh = on_refresh
+        self._memoria = None     # (timestamp, {nome: valor})
+        self._lock = threading.Lock()
+        self._atualizando = False
+        self._loop_iniciado = False
+
+    # ---------- fontes ----------
+    def _overrides(self) -> dict:
+        valores = {}
+        if self.secrets_file and Path(self.secrets_file).exists():
+            dados = json.loads(Path(self.secrets_file).read_text(encoding="utf-8"))
+            for nome, env in self.secrets.items():
+                v = dados.get(nome, dados.get(env))
+                if v:
+                    valores[nome] = str(v)
+        for nome, env in self.secrets.items():
+            if os.environ.get(env):
+                valores[nome] = os.environ[env]
+        return valores
+
+    def _ler_cache(self):
+        if self._memoria is not None:
+            return self._memoria
+        if self.cache_path is None or not self.cache_path.exists():
+            return None
+        try:
+            dados = json.loads(self.cache_path.read_text(encoding="utf-8"))
+            if dados.get("vault_url") != self._origem:
+                # cache de outro cofre (ou de versão antiga): ignora
+                return None
+            return float(dados["ts"]), dict(dados["values"])
+        except (OSError, ValueError, KeyError, AttributeError):
+            return None
+
+    def _gravar_cache(self, valores: dict):
+        ts = self._clock()
+        self._memoria = (ts, valores)
+        if self.cache_path is None:
+            return
+        # contém a chave da API: grava atômico e só legível pelo dono
+        self.cache_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        tmp = self.cache_path.with_suffix(".tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"ts": ts, "vault_url": self._origem, "values": valores}, f)
+        os.replace(tmp, self.cache_path)
+
+    def _buscar(self, nomes) -> dict:
+        def um(nome):
+            v = self.provider.get_secret(nome)
+            return nome, str(getattr(v, "value", v))
+
+        with ThreadPoolExecutor(max_workers=max(1, len(nomes))) as pool:
+            return dict(pool.map(um, nomes))
+
+    # ---------- refresh ----------
+    def refresh(self) -> dict:
+        nomes = [n for n in self.secrets if n not in self._overrides()]
+        novos = self._buscar(nomes) if nomes else {}
+        with self._lock:
+            antigos = (self._ler_cache() or (0, {}))[1]
+            self._gravar_cache(novos)
+        if novos != {n: antigos.get(n) for n in novos} and self.on_refresh is not None:
+            self.on_refresh(self.load())
+        return novos
+
+    def _refresh_background(self):
+        with self._lock:
+            if self._atualizando:
+                return
+            self._atualizando = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Key Vault fora: segue com o valor em cache e tenta no próximo ciclo
+                pass
+            finally:
+                self._atualizando = False
+
+        threading.Thread(target=run, name="secret-refresh", daemon=True).start()
+
+    def _iniciar_loop(self):
+        if self._loop_iniciado or self.ttl_s <= 0:
+            return
+        self._loop_iniciado = True
+
+        def loop():
+            while True:
+                time.sleep(self.ttl_s)
+                self._refresh_background()
+
+        threading.Thread(target=loop, name="secret-refresh-loop", daemon=True).start()
+
+    # ---------- API ----------
+    def load(self) -> dict:
+        valores = self._overrides()
+        faltando = [n for n in self.secrets if n not in valores]
+        if not faltando:
+            return valores
+
+        with self._lock:
+            cache = self._ler_cache()
+            if cache is not None and self._clock() - cache[0] > self.ttl_s + self.max_stale_s:
+                # vencido demais para servir: busca de forma síncrona
+                cache = None
+            if cache is not None:
+                self._memoria = cache
+        if cache is not None and all(n in cache[1] for n in faltando):
+            ts, em_cache = cache
+            if self._clock() - ts > self.ttl_s:
+                self._refresh_background()
+            self._iniciar_loop()
+            return {**{n: em_cache[n] for n in faltando}, **valores}
+
+        buscados = self._buscar(faltando)
+        with self._lock:
+            self._gravar_cache(buscados)
+        self._iniciar_loop()
+        return {**buscados, **valores}
@@ -0,0 +1,22 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture(scope="session")
+def rag_pipeline():
+    """
+    O pipeline completo (modelo de embeddings + índice FAISS). Importado só pelos
+    testes que precisam dele; credenciais fictícias, sem Key Vault nem cache em disco.
+    """
+    for env, valor in [("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1"), ("AZURE_OPENAI_API_VERSION", "2024-02-01"),
+                       ("AZURE_OPENAI_API_KEY", "test"), ("AZURE_OPENAI_CHAT_DEPLOY", "test")]:
+        os.environ.setdefault(env, valor)
+    os.environ.setdefault("RAG_SECRETS_CACHE", "")
+
+    import rag_pipeline
+    return rag_pipeline
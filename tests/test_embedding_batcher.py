@@ -0,0 +1,144 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from embedding_batcher import EmbeddingBatcher, EmbeddingIndisponivel
+
+
+def _vetores(textos):
+    return np.ones((len(textos), 4), dtype="float32")
+
+
+def _em_thread(fn, *args):
+    resultado = {}
+
+    def run():
+        try:
+            resultado["valor"] = fn(*args)
+        except BaseException as e:
+            resultado["erro"] = e
+
+    t = threading.Thread(target=run, daemon=True)
+    t.start()
+    return t, resultado
+
+
+def test_pedidos_simultaneos_viram_um_lote():
+    tamanhos = []
+
+    def encode(textos):
+        tamanhos.append(len(textos))
+        return _vetores(textos)
+
+    batcher = EmbeddingBatcher(encode, max_wait_ms=50)
+    threads = [_em_thread(batcher.encode, f"pergunta {i}") for i in range(8)]
+    for t, r in threads:
+        t.join(5)
+        assert r["valor"].shape == (1, 4)
+    assert sum(tamanhos) == 8 and len(tamanhos) < 8
+
+
+def test_encode_travado_segurando_o_modelo_nao_prende_os_outros_pedidos():
+    # como no pipeline: encode e fallback disputam o mesmo lock do modelo
+    modelo = threading.Lock()
+    liberar = threading.Event()
+
+    def encode(textos):
+        with modelo:
+            liberar.wait(10)
+            return _vetores(textos)
+
+    def fallback(textos):
+        if not modelo.acquire(timeout=0.2):
+            raise EmbeddingIndisponivel("modelo ocupado")
+        try:
+            return _vetores(textos)
+        finally:
+            modelo.release()
+
+    batcher = EmbeddingBatcher(encode, max_wait_ms=5, timeout_s=0.3, fallback_encode=fallback)
+    try:
+        preso, _ = _em_thread(batcher.encode, "primeira")
+        time.sleep(0.05)   # o worker já está dentro do encode travado
+
+        inicio = time.monotonic()
+        with pytest.raises(EmbeddingIndisponivel):
+            batcher.encode("segunda")
+        assert time.monotonic() - inicio < 2.0
+        assert batcher.metrics()["fallbacks"] >= 1
+    finally:
+        liberar.set()
+    preso.join(5)
+    assert batcher.encode("terceira").shape == (1, 4)
+
+
+def test_worker_trava_sem_lock_e_o_pedido_codifica_sozinho():
+    liberar = threading.Event()
+
+    def encode(textos):
+        if threading.current_thread().name == "embedding-batcher":
+            liberar.wait(10)
+        return _vetores(textos)
+
+    batcher = EmbeddingBatcher(encode, timeout_s=0.2)
+    try:
+        inicio = time.monotonic()
+        assert batcher.encode("a").shape == (1, 4)
+        assert time.monotonic() - inicio < 2.0
+        assert batcher.metrics()["fallbacks"] == 1
+    finally:
+        liberar.set()
+
+
+def test_excecao_no_encode_nao_mata_o_worker():
+    chamadas = []
+
+    def encode(textos):
+        chamadas.append(textos)
+        if len(chamadas) == 1:
+            raise SystemExit("boom")
+        return _vetores(textos)
+
+    batcher = EmbeddingBatcher(encode, timeout_s=1.0)
+    with pytest.raises(SystemExit):
+        batcher.encode("a")
+    assert batcher.encode("b").shape == (1, 4)
+    assert batcher._worker.is_alive()
+
+
+def test_worker_morto_e_recriado():
+    batcher = EmbeddingBatcher(_vetores)
+    batcher.encode("a")
+    morto = threading.Thread(target=lambda: None)
+    morto.start()
+    morto.join()
+    batcher._worker = morto
+
+    assert batcher.encode("b").shape == (1, 4)
+    assert batcher._worker is not morto and batcher._worker.is_alive()
+
+
+def test_pipeline_responde_fallback_com_modelo_travado(rag_pipeline, monkeypatch):
+    liberar = threading.Event()
+    encode_original = rag_pipeline.model_st.encode
+
+    def encode_travado(*args, **kwargs):
+        liberar.wait(10)
+        return encode_original(*args, **kwargs)
+
+    monkeypatch.setattr(rag_pipeline.model_st, "encode", encode_travado)
+    monkeypatch.setattr(rag_pipeline.query_embedder, "timeout_s", 0.2)
+    monkeypatch.setattr(rag_pipeline, "EMBED_TIMEOUT_S", 0.2)
+    try:
+        preso, _ = _em_thread(rag_pipeline.retrieve_faiss, "quais pratos levam queijo coalho? (travada)")
+        time.sleep(0.05)
+
+        inicio = time.monotonic()
+        r = rag_pipeline.answer_question("quais pratos levam castanha? (teste de travamento)", state={})
+        assert time.monotonic() - inicio < 2.0
+        assert r["fallback"] is True
+    finally:
+        liberar.set()
+    preso.join(5)
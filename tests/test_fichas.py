@@ -0,0 +1,166 @@
+import pandas as pd
+import pytest
+
+
+class StubClient:
+    """Substitui o AzureOpenAI: registra as chamadas e ecoa a pergunta."""
+
+    def __init__(self):
+        self.chamadas = []
+
+    def with_options(self, **kwargs):
+        return self
+
+    @property
+    def chat(self):
+        return self
+
+    @property
+    def completions(self):
+        return self
+
+    def create(self, model, messages, **kwargs):
+        from types import SimpleNamespace
+        self.chamadas.append(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="[stub]"))])
+
+
+@pytest.fixture
+def llm_stub(rag_pipeline, monkeypatch):
+    stub = StubClient()
+    monkeypatch.setattr(rag_pipeline, "client", stub)
+    return stub
+
+
+def _texto_ficha(rp, document_id):
+    df = pd.read_csv(rp.RAG_CHUNKS_PATH)
+    grupo = df[df["document_id"] == document_id].sort_values("chunk_id")
+    return rp._juntar_chunks(grupo["chunks"].fillna(""))
+
+
+# ---------- valores ----------
+@pytest.mark.parametrize("texto, minutos", [
+    ("45 minutos", 45),
+    ("1h30", 90),
+    ("1 hora", 60),
+    ("2 horas (geladeira)", 120),
+    ("Até 8 horas", 480),
+    (None, None),
+])
+def test_parse_minutos(rag_pipeline, texto, minutos):
+    assert rag_pipeline._parse_minutos(texto) == minutos
+
+
+@pytest.mark.parametrize("texto, faixa", [
+    ("R$ 40–45", (40.0, 45.0)),
+    ("R$ 30", (30.0, 30.0)),
+    ("R$ 12,50 a 15", (12.5, 15.0)),
+    (None, (None, None)),
+])
+def test_parse_faixa_preco(rag_pipeline, texto, faixa):
+    assert rag_pipeline._parse_faixa_preco(texto) == faixa
+
+
+# ---------- seções ----------
+def test_secoes_de_ficha_com_cabecalhos(rag_pipeline):
+    secoes = rag_pipeline.separar_secoes_ficha(_texto_ficha(rag_pipeline, "PDF_001"))
+    assert secoes["tempo_preparo"] == "45 minutos"
+    assert secoes["custo"] == "R$ 40–45"
+    assert "lactose" in secoes["restricoes"].lower()
+    assert secoes["harmonizacao"]
+    # o rodapé "Versão ... | Página N" não vaza para a última seção
+    assert "pagina" not in rag_pipeline._norm_text(secoes["custo"])
+
+
+def test_secoes_de_ficha_escaneada_com_rotulos_em_linha(rag_pipeline):
+    secoes = rag_pipeline.separar_secoes_ficha(_texto_ficha(rag_pipeline, "PDF_015"))
+    assert secoes == {
+        "ingredientes": "Maxixe, cebola, tomate, coentro, vinagre, azeite.",
+        "modo_preparo": "O maxixe é cozido rapidamente e resfriado. Mistura-se com os demais ingredientes e tempera-se.",
+        "tempo_preparo": "20 minutos",
+        "restricoes": "Vegano | Sem glúten",
+        "empratamento": "Tigela média",
+        "custo": "R$ 20–25",
+    }
+    ficha = rag_pipeline.fichas_df.set_index("document_id").loc["PDF_015"]
+    assert (ficha["tempo_min"], ficha["preco_min"], ficha["preco_max"]) == (20, 20.0, 25.0)
+    assert ficha["vegano"] and ficha["sem_gluten"] and not ficha["contem_lactose"]
+
+
+# ---------- filtros ----------
+@pytest.mark.parametrize("pergunta, filtros", [
+    ("sobremesas sem glúten até R$ 30", {"categoria": "Sobremesa", "sem_gluten": True, "preco_max": 30.0}),
+    ("pratos veganos até 20 reais", {"vegano": True, "preco_max": 20.0}),
+    ("quais pratos ficam prontos em até 30 minutos?", {"tempo_max": 30}),
+    ("pratos tradicionais sem lactose com preparo de no máximo 1 hora",
+     {"categoria": "Tradicional", "sem_lactose": True, "tempo_max": 60}),
+])
+def test_extrair_filtros_da_pergunta(rag_pipeline, pergunta, filtros):
+    assert rag_pipeline.extrair_filtros_da_pergunta(pergunta) == filtros
+
+
+@pytest.mark.parametrize("pergunta, esperado", [
+    ("sobremesas sem glúten até R$ 30", True),
+    ("quais pratos são veganos?", True),
+    ("o Quindim é sem glúten?", False),
+    ("o que é o baião de dois?", False),
+    ("quais pratos da categoria sobremesa?", False),
+])
+def test_eh_pergunta_filtro_cardapio(rag_pipeline, pergunta, esperado):
+    assert rag_pipeline.eh_pergunta_filtro_cardapio(pergunta) is esperado
+
+
+def test_filtro_sobremesas_sem_gluten_ate_30(rag_pipeline):
+    pratos = rag_pipeline.filtrar_fichas("Sobremesa", sem_gluten=True, preco_max=30)
+    assert len(pratos) > 0
+    assert (pratos["categoria"] == "Sobremesa").all()
+    assert pratos["sem_gluten"].all()
+    assert (pratos["preco_max"] <= 30).all()
+
+
+# ---------- campos da ficha ----------
+@pytest.mark.parametrize("pergunta, campos", [
+    ("quanto custa?", ["preco"]),
+    ("qual o valor?", ["preco"]),
+    ("qual o valor do Quindim?", ["preco"]),
+    ("qual o valor nutricional do Quindim?", []),
+    ("quanto tempo demora?", ["tempo"]),
+    ("tem lactose?", ["lactose"]),
+    ("qual a harmonização?", ["harmonizacao"]),
+    ("qual bebida combina?", ["harmonizacao"]),
+    ("vocês têm bebida sem álcool?", []),
+    ("quais os ingredientes?", []),
+])
+def test_detectar_campos_ficha(rag_pipeline, pergunta, campos):
+    assert rag_pipeline.detectar_campos_ficha(pergunta) == campos
+
+
+def test_resposta_campos_ficha(rag_pipeline):
+    assert rag_pipeline.resposta_campos_ficha("Quindim", ["preco"]) == "O custo médio do prato **Quindim** é **R$ 12–15**."
+    assert "contém lactose" in rag_pipeline.resposta_campos_ficha("Baiao-de-Dois", ["lactose"])
+    assert "vegano" in rag_pipeline.resposta_campos_ficha("Salada de Maxixe", ["lactose"])
+    assert rag_pipeline.resposta_campos_ficha("Prato Inexistente", ["preco"]) is None
+
+
+def test_valor_nutricional_nao_vira_preco(rag_pipeline, llm_stub):
+    r = rag_pipeline.answer_question("qual o valor nutricional do Quindim?", state={})
+    assert "custo médio" not in r["text"]
+    assert llm_stub.chamadas
+
+
+def test_followups_de_campo_sem_llm(rag_pipeline, llm_stub):
+    state = rag_pipeline.answer_question("o que é o Baião-de-Dois?", state={})["state"]
+    llm_stub.chamadas.clear()
+
+    assert "R$ 40–45" in rag_pipeline.answer_question("quanto custa?", state=state)["text"]
+    assert "harmonização" in rag_pipeline.answer_question("qual bebida combina?", state=state)["text"]
+    assert llm_stub.chamadas == []
+
+
+def test_perguntas_gerais_nao_usam_o_prato_atual(rag_pipeline, llm_stub):
+    state = rag_pipeline.answer_question("o que é o Baião-de-Dois?", state={})["state"]
+
+    r = rag_pipeline.answer_question("quais pratos da categoria sobremesa têm lactose?", state=state)
+    assert r["text"].startswith("Pratos da categoria **Sobremesa**")
+    r = rag_pipeline.answer_question("quais pratos têm lactose?", state=state)
+    assert "Baiao-de-Dois** contém lactose" not in r["text"]
@@ -0,0 +1,63 @@
+import httpx
+import pytest
+from openai import APIStatusError
+
+from llm_resilience import CircuitBreaker, LLMIndisponivel, ResilientLLM
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+def _erro_http(status: int) -> APIStatusError:
+    request = httpx.Request("POST", "http://127.0.0.1/chat/completions")
+    return APIStatusError(f"HTTP {status}", response=httpx.Response(status, request=request), body=None)
+
+
+def _llm(respostas, breaker):
+    respostas = list(respostas)
+
+    def call(system, user, timeout=None):
+        r = respostas.pop(0)
+        if isinstance(r, BaseException):
+            raise r
+        return r
+
+    return ResilientLLM(call, deadline_s=5.0, max_retries=0, backoff_base_s=0.0, hedge=False, breaker=breaker)
+
+
+def test_breaker_fecha_quando_probe_recebe_4xx():
+    relogio = Relogio()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout_s=30.0, clock=relogio)
+    llm = _llm([_erro_http(500), _erro_http(500), _erro_http(400), "ok"], breaker)
+
+    for _ in range(2):
+        with pytest.raises(LLMIndisponivel):
+            llm.complete("s", "u")
+    assert breaker.state == "open"
+    with pytest.raises(LLMIndisponivel, match="circuito aberto"):
+        llm.complete("s", "u")
+
+    # passa o reset: a próxima chamada é o probe do half_open e recebe um 400
+    relogio.agora += 31.0
+    with pytest.raises(APIStatusError):
+        llm.complete("s", "u")
+    assert breaker.state == "closed"
+    assert llm.complete("s", "u") == "ok"
+
+
+def test_breaker_reabre_quando_probe_sai_por_excecao_inesperada():
+    relogio = Relogio()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=30.0, clock=relogio)
+    llm = _llm([_erro_http(503), KeyboardInterrupt()], breaker)
+
+    with pytest.raises(LLMIndisponivel):
+        llm.complete("s", "u")
+    relogio.agora += 31.0
+    with pytest.raises(KeyboardInterrupt):
+        llm.complete("s", "u")
+    assert breaker.state == "open"
@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+
+import pytest
+
+from secrets_loader import KeyVaultSecretProvider, SecretLoader
+
+SEGREDOS = {
+    "URL-API-GPT": "TEST_RAG_ENDPOINT",
+    "VERSION-API-GPT": "TEST_RAG_API_VERSION",
+    "KEY-API-GPT": "TEST_RAG_API_KEY",
+    "MODELO-APT-GPT": "TEST_RAG_CHAT_DEPLOY",
+}
+TTL = 900.0
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1_000_000.0
+
+    def __call__(self):
+        return self.agora
+
+
+class FakeProvider:
+    """Provider local: `get_secret` demora `latencia_s` e conta chamadas concorrentes."""
+
+    def __init__(self, latencia_s: float = 0.0, versao: str = "v1"):
+        self.latencia_s = latencia_s
+        self.versao = versao
+        self.chamadas = []
+        self.liberar = threading.Event()
+        self.liberar.set()
+        self._lock = threading.Lock()
+        self._ativas = 0
+        self.max_simultaneas = 0
+
+    def get_secret(self, nome):
+        with self._lock:
+            self.chamadas.append(nome)
+            self._ativas += 1
+            self.max_simultaneas = max(self.max_simultaneas, self._ativas)
+        try:
+            self.liberar.wait(5)
+            time.sleep(self.latencia_s)
+            return f"{nome}:{self.versao}"
+        finally:
+            with self._lock:
+                self._ativas -= 1
+
+
+@pytest.fixture(autouse=True)
+def _sem_overrides(monkeypatch):
+    for env in SEGREDOS.values():
+        monkeypatch.delenv(env, raising=False)
+
+
+def _esperar(cond, timeout=5.0):
+    fim = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < fim, "condição não atingida a tempo"
+        time.sleep(0.01)
+
+
+def test_busca_todos_os_segredos_em_paralelo():
+    provider = FakeProvider(latencia_s=0.2)
+    inicio = time.monotonic()
+    valores = SecretLoader(provider, SEGREDOS, ttl_s=0).load()
+
+    assert valores == {n: f"{n}:v1" for n in SEGREDOS}
+    assert provider.max_simultaneas == len(SEGREDOS)
+    assert time.monotonic() - inicio < 0.2 * len(SEGREDOS)
+
+
+def test_overrides_de_env_e_arquivo_nao_vao_ao_provider(monkeypatch, tmp_path):
+    arquivo = tmp_path / "segredos.json"
+    arquivo.write_text(json.dumps({"URL-API-GPT": "http://arquivo", "TEST_RAG_API_VERSION": "2024-02-01"}))
+    monkeypatch.setenv("TEST_RAG_API_KEY", "chave-env")
+    provider = FakeProvider()
+
+    valores = SecretLoader(provider, SEGREDOS, ttl_s=0, secrets_file=str(arquivo)).load()
+
+    assert valores["URL-API-GPT"] == "http://arquivo"
+    assert valores["VERSION-API-GPT"] == "2024-02-01"
+    assert valores["KEY-API-GPT"] == "chave-env"
+    assert provider.chamadas == ["MODELO-APT-GPT"]
+
+
+def test_dentro_do_ttl_serve_do_cache():
+    relogio = Relogio()
+    provider = FakeProvider()
+    loader = SecretLoader(provider, SEGREDOS, ttl_s=TTL, clock=relogio)
+
+    primeiro = loader.load()
+    relogio.agora += TTL - 1
+    assert loader.load() == primeiro
+    assert len(provider.chamadas) == len(SEGREDOS)
+
+
+def test_vencido_responde_na_hora_e_atualiza_em_background():
+    relogio = Relogio()
+    provider = FakeProvider()
+    rotacoes = []
+    loader = SecretLoader(provider, SEGREDOS, ttl_s=TTL, clock=relogio, on_refresh=rotacoes.append)
+    loader.load()
+
+    # chave rotacionada no cofre; o provider fica "lento" até liberarmos
+    provider.versao = "v2"
+    provider.liberar.clear()
+    relogio.agora += TTL + 1
+    inicio = time.monotonic()
+    valores = loader.load()
+    assert time.monotonic() - inicio < 1.0
+    assert valores["KEY-API-GPT"] == "KEY-API-GPT:v1"
+
+    provider.liberar.set()
+    _esperar(lambda: loader.load()["KEY-API-GPT"] == "KEY-API-GPT:v2")
+    _esperar(lambda: rotacoes)
+    assert rotacoes[0]["KEY-API-GPT"] == "KEY-API-GPT:v2"
+
+
+def test_on_refresh_so_quando_algum_valor_muda():
+    provider = FakeProvider()
+    rotacoes = []
+    loader = SecretLoader(provider, SEGREDOS, ttl_s=TTL, on_refresh=rotacoes.append)
+    loader.load()
+
+    loader.refresh()
+    assert rotacoes == []
+
+    provider.versao = "v2"
+    loader.refresh()
+    assert len(rotacoes) == 1
+    assert rotacoes[0] == {n: f"{n}:v2" for n in SEGREDOS}
+
+
+def test_vencido_alem_de_max_stale_busca_de_forma_sincrona():
+    relogio = Relogio()
+    provider = FakeProvider()
+    loader = SecretLoader(provider, SEGREDOS, ttl_s=TTL, max_stale_s=3600, clock=relogio)
+    loader.load()
+
+    provider.versao = "v2"
+    relogio.agora += TTL + 3600 + 1
+    assert loader.load()["KEY-API-GPT"] == "KEY-API-GPT:v2"
+
+
+class FakeKeyVault(KeyVaultSecretProvider):
+    def __init__(self, vault_url, versao="v1"):
+        super().__init__(vault_url)
+        self.versao = versao
+        self.chamadas = 0
+
+    def get_secret(self, nome):
+        self.chamadas += 1
+        return f"{nome}:{self.versao}"
+
+
+def test_cache_em_disco_ligado_ao_cofre(tmp_path):
+    cache = tmp_path / "cache" / "secrets.json"
+    SecretLoader(FakeKeyVault("https://a.vault.azure.net"), SEGREDOS, cache_path=str(cache), ttl_s=TTL).load()
+    assert json.loads(cache.read_text())["vault_url"] == "https://a.vault.azure.net"
+    assert cache.stat().st_mode & 0o777 == 0o600
+
+    # mesmo cofre: serve do disco, sem ir ao provider
+    mesmo = FakeKeyVault("https://a.vault.azure.net", versao="v2")
+    assert SecretLoader(mesmo, SEGREDOS, cache_path=str(cache), ttl_s=TTL).load()["KEY-API-GPT"] == "KEY-API-GPT:v1"
+    assert mesmo.chamadas == 0
+
+    # outro cofre: ignora o cache
+    outro = FakeKeyVault("https://b.vault.azure.net", versao="v3")
+    assert SecretLoader(outro, SEGREDOS, cache_path=str(cache), ttl_s=TTL).load()["KEY-API-GPT"] == "KEY-API-GPT:v3"
+
+    # provider que não é Key Vault: nunca lê nem grava o disco
+    antes = cache.read_text()
+    assert SecretLoader(FakeProvider(versao="v4"), SEGREDOS, cache_path=str(cache), ttl_s=TTL).load()
+    assert cache.read_text() == antes
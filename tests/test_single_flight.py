@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from llm_resilience import SingleFlight
+
+N_THREADS = 16
+
+
+def _em_paralelo(sf, fn, key="k"):
+    """Dispara N_THREADS chamadas `sf.do(key, fn)` e devolve (resultados, erros)."""
+    resultados, erros = [], []
+    lock = threading.Lock()
+    chegaram = threading.Semaphore(0)
+
+    def worker():
+        chegaram.release()
+        try:
+            r = sf.do(key, fn)
+            with lock:
+                resultados.append(r)
+        except Exception as e:
+            with lock:
+                erros.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(N_THREADS)]
+    for t in threads:
+        t.start()
+    for _ in threads:
+        chegaram.acquire()
+    return threads, resultados, erros
+
+
+def test_mesma_chave_executa_uma_vez_e_todos_recebem_o_resultado():
+    sf = SingleFlight()
+    chamadas = []
+    liberar = threading.Event()
+
+    def fn():
+        chamadas.append(1)
+        liberar.wait(5)
+        return "resposta"
+
+    threads, resultados, erros = _em_paralelo(sf, fn)
+    time.sleep(0.1)   # dá tempo de todas as threads entrarem no do()
+    liberar.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(chamadas) == 1
+    assert resultados == ["resposta"] * N_THREADS
+    assert erros == []
+
+
+def test_excecao_do_lider_chega_a_todos():
+    sf = SingleFlight()
+    chamadas = []
+    liberar = threading.Event()
+    erro = RuntimeError("LLM fora")
+
+    def fn():
+        chamadas.append(1)
+        liberar.wait(5)
+        raise erro
+
+    threads, resultados, erros = _em_paralelo(sf, fn)
+    time.sleep(0.1)
+    liberar.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(chamadas) == 1
+    assert resultados == []
+    assert len(erros) == N_THREADS and all(e is erro for e in erros)
+
+
+def test_chave_liberada_ao_terminar():
+    # não é cache: depois que a chamada termina, a próxima executa de novo
+    sf = SingleFlight()
+    chamadas = []
+    assert sf.do("k", lambda: chamadas.append(1) or 1) == 1
+    assert sf.do("k", lambda: chamadas.append(1) or 2) == 2
+    assert len(chamadas) == 2
+
+    def falha():
+        raise ValueError("x")
+
+    with pytest.raises(ValueError):
+        sf.do("k", falha)
+    assert sf.do("k", lambda: 3) == 3
+
+
+def test_chave_llm_normaliza_pergunta_e_separa_contexto(rag_pipeline):
+    k = rag_pipeline._chave_llm("Quanto custa o Quindim?", "ctx")
+    assert k == rag_pipeline._chave_llm("  quanto CUSTA o quindim ", "ctx")
+    assert k != rag_pipeline._chave_llm("Quanto custa o Quindim?", "outro ctx")